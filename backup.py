@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List
+import json
+import os
+import re
+import sqlite3
+import time
+from sqlalchemy import Connection
+
+WATERMARKS_FILE: str = "watermarks.json"
+CHANGE_LOG: str = "backup_changes"
+# in a delta file, the rows deleted since the previous backup
+DELETED_TABLE: str = "backup_deleted"
+
+
+@dataclass
+class BackupReport:
+    path: str
+    bytes_copied: int
+    seconds: float
+    # how long writers could not commit: total over all steps and the longest step
+    locked_seconds: float
+    max_locked_seconds: float
+    # times a full backup started over because the source was written to
+    restarts: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.path}: {self.bytes_copied} bytes in {self.seconds:.3f}s, "
+            f"writers locked {self.locked_seconds * 1000:.1f}ms "
+            f"(longest {self.max_locked_seconds * 1000:.1f}ms), "
+            f"{self.restarts} restarts"
+        )
+
+
+# one row per insert, update or delete of a row of a logged table;
+# AUTOINCREMENT so that seq keeps growing after the log is pruned
+CHANGE_LOG_DDL: str = (
+    f"CREATE TABLE IF NOT EXISTS {CHANGE_LOG} ("
+    "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "table_name TEXT NOT NULL, "
+    "row_id INTEGER NOT NULL)"
+)
+
+
+def _log_triggers(table: str) -> Dict[str, str]:
+    triggers: Dict[str, str] = {}
+    for event, body in [
+        ("INSERT", f"VALUES ('{table}', new.id)"),
+        # an update of id itself also logs the old id, as gone
+        ("UPDATE", f"SELECT '{table}', new.id UNION SELECT '{table}', old.id"),
+        ("DELETE", f"VALUES ('{table}', old.id)"),
+    ]:
+        name = f"{table}_log_{event.lower()}"
+        triggers[name] = (
+            f"CREATE TRIGGER {name} AFTER {event} ON {table} BEGIN\n"
+            f"INSERT INTO {CHANGE_LOG}(table_name, row_id) {body};\nEND"
+        )
+    return triggers
+
+
+def ensure_change_log(conn: Connection, tables: List[str]) -> None:
+    """Create the change log and the triggers filling it for TABLES"""
+
+    conn.exec_driver_sql(CHANGE_LOG_DDL)
+    installed = dict(
+        conn.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"
+        ).all()
+    )
+    for table in tables:
+        for name, sql in _log_triggers(table).items():
+            if installed.get(name) != sql:
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+                conn.exec_driver_sql(sql)
+
+
+def _last_change(conn: sqlite3.Connection) -> int:
+    """Sequence number of the last logged change, 0 if there is none"""
+
+    # sqlite_sequence only exists once a table with AUTOINCREMENT does
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'"
+    ).fetchone():
+        return 0
+    row = conn.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = ?", (CHANGE_LOG,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def _prune_change_log(conn: sqlite3.Connection, seq: int) -> None:
+    """Forget the changes up to SEQ, they are in a backup now"""
+
+    try:
+        conn.execute(f"DELETE FROM {CHANGE_LOG} WHERE seq <= ?", (seq,))
+    except sqlite3.OperationalError:
+        pass  # locked, the next backup prunes them
+
+
+def _load_watermark(backup_dir: str) -> int:
+    path = os.path.join(backup_dir, WATERMARKS_FILE)
+    if not os.path.exists(path):
+        raise RuntimeError(f"{path} not found, run a full backup first")
+    with open(path) as f:
+        watermarks = json.load(f)
+    if "seq" not in watermarks:
+        raise RuntimeError(f"{path} is from an older version, run a full backup first")
+    return watermarks["seq"]
+
+
+def _save_watermark(backup_dir: str, seq: int) -> None:
+    path = os.path.join(backup_dir, WATERMARKS_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"seq": seq}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _stamp() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class _BackupProgress:
+    """Progress callback of Connection.backup(): times the steps, counts
+    the pages copied and the restarts, pauses between the steps"""
+
+    def __init__(self, sleep: float, max_restarts: int | None) -> None:
+        self.sleep = sleep
+        self.max_restarts = max_restarts
+        self.steps: List[float] = []
+        self.pages_copied: int = 0
+        self.restarts: int = 0
+        self.remaining: int | None = None
+        self.step_started: float = time.perf_counter()
+
+    def __call__(self, status: int, remaining: int, total: int) -> None:
+        # a step that got SQLITE_BUSY/LOCKED held no lock and copied nothing
+        if status in (sqlite3.SQLITE_OK, sqlite3.SQLITE_DONE):
+            self.steps.append(time.perf_counter() - self.step_started)
+            if self.remaining is not None and remaining >= self.remaining:
+                # another connection wrote to the source, SQLite started over
+                self.restarts += 1
+                self.pages_copied += total - remaining
+            else:
+                previous = total if self.remaining is None else self.remaining
+                self.pages_copied += previous - remaining
+            self.remaining = remaining
+            if self.max_restarts is not None and self.restarts > self.max_restarts:
+                raise _TooManyRestarts()
+        # Connection.backup() itself only sleeps after a busy step
+        if remaining:
+            time.sleep(self.sleep)
+        self.step_started = time.perf_counter()
+
+
+def full_backup(
+    db_path: str,
+    backup_dir: str,
+    pages: int = 64,
+    sleep: float = 0.005,
+    max_restarts: int = 3,
+) -> BackupReport:
+    """Copy DB_PATH into BACKUP_DIR with the SQLite online backup API
+
+    The copy is done PAGES pages at a time with a pause of SLEEP seconds
+    after each step.  In WAL mode the whole copy runs in one read
+    transaction of the source, so it sees one snapshot and writers are
+    not held back.  Otherwise the source is only locked while a step
+    runs, but a commit during a pause makes SQLite start over; after
+    MAX_RESTARTS restarts the rest is copied in one step, which blocks
+    writers until it is done.
+    Resets the incremental watermark to the last change in the copy."""
+
+    os.makedirs(backup_dir, exist_ok=True)
+    target_path = os.path.join(backup_dir, f"full-{_stamp()}.db")
+    started = time.perf_counter()
+    src = sqlite3.connect(db_path, isolation_level=None)
+    dst = sqlite3.connect(target_path)
+    try:
+        (journal_mode,) = src.execute("PRAGMA journal_mode").fetchone()
+        if journal_mode == "wal":
+            progress = _BackupProgress(sleep, None)
+            src.execute("BEGIN")
+            src.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            try:
+                src.backup(dst, pages=pages, progress=progress, sleep=0)
+            finally:
+                src.execute("COMMIT")
+        else:
+            progress = _BackupProgress(sleep, max_restarts)
+            try:
+                src.backup(dst, pages=pages, progress=progress, sleep=0)
+            except _TooManyRestarts:
+                progress.max_restarts = None
+                progress.remaining = None
+                progress.step_started = time.perf_counter()
+                src.backup(dst, pages=-1, progress=progress, sleep=0)
+        page_size = dst.execute("PRAGMA page_size").fetchone()[0]
+        seq = _last_change(dst)
+        _save_watermark(backup_dir, seq)
+        _prune_change_log(src, seq)
+    finally:
+        src.close()
+        dst.close()
+    return BackupReport(
+        path=target_path,
+        bytes_copied=progress.pages_copied * page_size,
+        seconds=time.perf_counter() - started,
+        locked_seconds=sum(progress.steps),
+        max_locked_seconds=max(progress.steps, default=0.0),
+        restarts=progress.restarts,
+    )
+
+
+def incremental_backup(db_path: str, backup_dir: str) -> BackupReport:
+    """Copy the rows changed since the last backup into a delta file in BACKUP_DIR
+
+    The changed rows are taken from the change log, filled by triggers
+    on inserts, updates and deletes.  The delta file has the current
+    version of every inserted or updated row in a table of the same
+    name, and the ids of the deleted rows in backup_deleted."""
+
+    watermark = _load_watermark(backup_dir)
+    target_path = os.path.join(backup_dir, f"incr-{_stamp()}.db")
+    started = time.perf_counter()
+    src = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        src.execute("ATTACH DATABASE ? AS delta", (target_path,))
+        # one read transaction gives a consistent snapshot; it is the
+        # only time writers are held back
+        locked_started = time.perf_counter()
+        src.execute("BEGIN")
+        try:
+            if not src.execute(
+                "SELECT 1 FROM main.sqlite_master WHERE name = ?", (CHANGE_LOG,)
+            ).fetchone():
+                raise RuntimeError(f"{db_path} has no change log, run a full backup")
+            seq = _last_change(src)
+            if seq < watermark:
+                raise RuntimeError(
+                    f"{db_path} is older than the last backup, run a full backup"
+                )
+            src.execute(
+                f"CREATE TABLE delta.{DELETED_TABLE} "
+                "(table_name TEXT NOT NULL, row_id INTEGER NOT NULL)"
+            )
+            changed = f"SELECT row_id FROM {CHANGE_LOG} WHERE seq > ? AND table_name = ?"
+            tables = src.execute(
+                f"SELECT DISTINCT table_name FROM {CHANGE_LOG} WHERE seq > ?",
+                (watermark,),
+            ).fetchall()
+            for (table,) in tables:
+                (create_sql,) = src.execute(
+                    "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                    (table,),
+                ).fetchone()
+                src.execute(re.sub(r"^CREATE TABLE\s+", "CREATE TABLE delta.", create_sql))
+                src.execute(
+                    f'INSERT INTO delta."{table}" SELECT * FROM main."{table}" '
+                    f"WHERE id IN ({changed})",
+                    (watermark, table),
+                )
+                src.execute(
+                    f"INSERT INTO delta.{DELETED_TABLE} SELECT DISTINCT ?, row_id "
+                    f"FROM ({changed}) "
+                    f'WHERE row_id NOT IN (SELECT id FROM main."{table}")',
+                    (table, watermark, table),
+                )
+            src.execute("COMMIT")
+        except BaseException:
+            src.execute("ROLLBACK")
+            src.execute("DETACH DATABASE delta")
+            os.remove(target_path)
+            raise
+        locked = time.perf_counter() - locked_started
+        src.execute("DETACH DATABASE delta")
+        _save_watermark(backup_dir, seq)
+        _prune_change_log(src, seq)
+    finally:
+        src.close()
+    return BackupReport(
+        path=target_path,
+        bytes_copied=os.path.getsize(target_path),
+        seconds=time.perf_counter() - started,
+        locked_seconds=locked,
+        max_locked_seconds=locked,
+    )
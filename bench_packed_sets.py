@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+"""Compare one Exercise row per set with PackedSets rows
+
+Reports db file size, insert time and the time to read the whole
+history of one exercise for both layouts."""
+from typing import Callable, List, Tuple
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+
+import argparse
+import argcomplete
+import os
+import tempfile
+import time
+import model as MD
+import dispatcher as D
+
+parser = argparse.ArgumentParser(
+    description="Benchmark row-per-set against packed set storage",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+parser.add_argument("--workouts", type=int, default=2000, help="workouts to insert")
+parser.add_argument("--exercises", type=int, default=4, help="exercises per workout")
+parser.add_argument("--sets", type=int, default=5, help="sets per exercise")
+parser.add_argument("--history", default="squat", help="exercise whose history is read")
+
+
+def timed(func: Callable[[], object]) -> Tuple[float, object]:
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def insert_rows(session: MD.Session, names: List[MD.ExerciseName], args) -> None:
+    start = datetime(2020, 1, 1)
+    for i in range(args.workouts):
+        workout = MD.Workout(started=start + timedelta(days=i))
+        for name in names:
+            for s in range(args.sets):
+                workout.exercises.append(
+                    MD.Exercise(weight=100.0 + s * 2.5, reps=5, exercise_name=name)
+                )
+        session.add(workout)
+    session.commit()
+
+
+def insert_packed(session: MD.Session, names: List[MD.ExerciseName], args) -> None:
+    start = datetime(2020, 1, 1)
+    for i in range(args.workouts):
+        workout = MD.Workout(started=start + timedelta(days=i))
+        for name in names:
+            packed = MD.PackedSets(exercise_name=name)
+            packed.sets = [(100.0 + s * 2.5, 5) for s in range(args.sets)]
+            workout.packed_sets.append(packed)
+        session.add(workout)
+    session.commit()
+
+
+def history_rows(session: MD.Session, name: MD.ExerciseName) -> List[Tuple[float, int]]:
+    query = (
+        session.query(MD.Exercise.weight, MD.Exercise.reps)
+        .join(MD.Workout)
+        .filter(MD.Exercise.exercise_name_id == name.id)
+        .order_by(MD.Workout.started, MD.Exercise.id)
+    )
+    return [(weight, reps) for weight, reps in query]
+
+
+def history_packed(
+    session: MD.Session, name: MD.ExerciseName
+) -> List[Tuple[float, int]]:
+    query = (
+        session.query(MD.PackedSets.data)
+        .join(MD.Workout)
+        .filter(MD.PackedSets.exercise_name_id == name.id)
+        .order_by(MD.Workout.started)
+    )
+    return [s for (data,) in query for s in MD.SetList(data)]
+
+
+def run(layout: str, insert, history, db_path: str, args) -> None:
+    engine = create_engine(f"sqlite+pysqlite:///{db_path}", future=True)
+    MD.ensure_schema(engine)
+    with MD.Session(engine) as session:
+        dispatcher = D.Dispatcher(session)
+        dispatcher.init_exercises()
+        names = session.query(MD.ExerciseName).limit(args.exercises).all()
+        history_name = MD.ensure_exercise(session, args.history)
+        if history_name not in names:
+            names[-1] = history_name
+        insert_seconds, _ = timed(lambda: insert(session, names, args))
+    with MD.Session(engine) as session:
+        history_name = MD.ensure_exercise(session, args.history)
+        read_seconds, sets = timed(lambda: history(session, history_name))
+    engine.dispose()
+    print(
+        f"{layout:8} {os.path.getsize(db_path):>12} {insert_seconds:>10.3f}"
+        f" {read_seconds:>10.4f} {len(sets):>8}"
+    )
+
+
+if __name__ == "__main__":
+    argcomplete.autocomplete(parser)
+    args = parser.parse_args()
+    print(f"{'layout':8} {'size, bytes':>12} {'insert, s':>10} {'history, s':>10} {'sets':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        run("rows", insert_rows, history_rows, os.path.join(tmp, "rows.db"), args)
+        run("packed", insert_packed, history_packed, os.path.join(tmp, "packed.db"), args)
@@ -5,6 +5,9 @@ from typing import Callable
 from sqlalchemy.orm import Session
 from datetime import datetime
 import model as MD
+import backup as BK
+import search as SR
+import retry as RT
 
 
 def mark_command(func):
@@ -23,11 +26,25 @@ class Dispatcher:
         "overhead press",
         "biceps curl",
     ]
+    backup_dir: str = "backup"
+    search_query: str = ""
+    search_since: datetime | None = None
+    search_until: datetime | None = None
+    search_limit: int = 20
+    retry_policy: RT.RetryPolicy = RT.RetryPolicy()
 
     def __init__(self, session: Session) -> None:
         self.session = session
+        self.retry_stats = RT.RetryStats()
         self.ensure_commands_collected()
 
+    def run(self, cmd_name: str) -> None:
+        """Run command CMD_NAME, retrying it while the db is locked"""
+
+        RT.run_with_retry(
+            self.session, getattr(self, cmd_name), self.retry_policy, self.retry_stats
+        )
+
     @mark_command
     def init_exercises(self) -> None:
         for name in self.exercise_names:
@@ -62,6 +79,74 @@ class Dispatcher:
         self.session.delete(workout)
         self.session.commit()
 
+    @mark_command
+    def pack_sets(self) -> None:
+        """Move the Exercise rows into one PackedSets row per workout and exercise"""
+
+        groups: dict[tuple[int, int], list[MD.Exercise]] = {}
+        for exercise in self.session.query(MD.Exercise).order_by(MD.Exercise.id):
+            key = (exercise.workout_id, exercise.exercise_name_id)
+            groups.setdefault(key, []).append(exercise)
+        for (workout_id, exercise_name_id), exercises in groups.items():
+            packed = (
+                self.session.query(MD.PackedSets)
+                .filter_by(workout_id=workout_id, exercise_name_id=exercise_name_id)
+                .first()
+            )
+            if packed is None:
+                packed = MD.PackedSets(
+                    workout_id=workout_id, exercise_name_id=exercise_name_id
+                )
+                self.session.add(packed)
+            packed.sets = list(packed.sets) + [(e.weight, e.reps) for e in exercises]
+            for exercise in exercises:
+                self.session.delete(exercise)
+        self.session.commit()
+
+    @mark_command
+    def unpack_sets(self) -> None:
+        """Move the PackedSets rows back to one Exercise row per set"""
+
+        for packed in self.session.query(MD.PackedSets).order_by(MD.PackedSets.id):
+            for weight, reps in packed.sets:
+                self.session.add(
+                    MD.Exercise(
+                        weight=weight,
+                        reps=reps,
+                        workout_id=packed.workout_id,
+                        exercise_name_id=packed.exercise_name_id,
+                    )
+                )
+            self.session.delete(packed)
+        self.session.commit()
+
+    @mark_command
+    def search(self) -> None:
+        for hit in SR.search(
+            self.session,
+            self.search_query,
+            self.search_since,
+            self.search_until,
+            self.search_limit,
+        ):
+            print(hit)
+
+    def _db_path(self) -> str:
+        db_path = self.session.get_bind().url.database
+        if not db_path or db_path == ":memory:":
+            raise RuntimeError("backup needs a --permanent-db")
+        return db_path
+
+    @mark_command
+    def backup(self) -> None:
+        self.session.commit()
+        print(BK.full_backup(self._db_path(), self.backup_dir))
+
+    @mark_command
+    def backup_incremental(self) -> None:
+        self.session.commit()
+        print(BK.incremental_backup(self._db_path(), self.backup_dir))
+
     @classmethod
     def collect_commands(cls):
         cls.commands = [
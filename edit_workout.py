@@ -6,10 +6,12 @@ from sqlalchemy import (
     create_engine,
 )
 
+from datetime import datetime
 import argparse
 import argcomplete
 import model as MD
 import dispatcher as D
+import retry as RT
 
 
 parser = argparse.ArgumentParser(
@@ -24,6 +26,26 @@ parser.add_argument("--memory-db", help="use memory db")
 parser.add_argument(
     "--echo", help="Show db commands", action="store_true", default=False
 )
+parser.add_argument(
+    "--busy-timeout", type=float, default=5.0, help="seconds to wait for a db lock"
+)
+parser.add_argument(
+    "--attempts", type=int, default=5, help="times to try a command while db is locked"
+)
+parser.add_argument(
+    "--backoff", type=float, default=0.05, help="seconds to wait before the 2nd attempt"
+)
+parser.add_argument(
+    "--max-backoff", type=float, default=2.0, help="max seconds to wait between attempts"
+)
+parser.add_argument("--query", default="", help="text to search for")
+parser.add_argument(
+    "--since", type=datetime.fromisoformat, help="search workouts started since"
+)
+parser.add_argument(
+    "--until", type=datetime.fromisoformat, help="search workouts started before"
+)
+parser.add_argument("--limit", type=int, default=20, help="max search results")
 
 
 if __name__ == "__main__":
@@ -46,12 +68,20 @@ if __name__ == "__main__":
             f"sqlite+pysqlite:///{args.permanent_db}",
             echo=args.echo,
             future=True,
+            connect_args={"timeout": args.busy_timeout},
         )
     else:
         raise RuntimeError("--permanent-db or --memory-db expected")
 
-    MD.Base.metadata.create_all(engine)
+    MD.ensure_schema(engine)
     with MD.Session(engine) as session:
         dispatcher: D.Dispatcher = D.Dispatcher(session)
+        dispatcher.search_query = args.query
+        dispatcher.search_since = args.since
+        dispatcher.search_until = args.until
+        dispatcher.search_limit = args.limit
+        dispatcher.retry_policy = RT.RetryPolicy(
+            attempts=args.attempts, backoff=args.backoff, max_backoff=args.max_backoff
+        )
         for cmd_name in args.command:
-            getattr(dispatcher, cmd_name)()
+            dispatcher.run(cmd_name)
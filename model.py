@@ -5,8 +5,14 @@ from sqlalchemy import (
     Integer,
     Float,
     String,
+    Text,
     DateTime,
     ForeignKey,
+    LargeBinary,
+    UniqueConstraint,
+    Index,
+    Engine,
+    inspect,
 )
 from sqlalchemy.orm import (
     DeclarativeBase,
@@ -14,9 +20,15 @@ from sqlalchemy.orm import (
     Mapped,
     mapped_column,
     Session,
+    reconstructor,
 )
+from array import array
+from collections.abc import Sequence
 from datetime import datetime
-from typing import List
+from typing import Iterable, List, Tuple
+import struct
+import search as SR
+import backup as BK
 
 
 class Base(DeclarativeBase):
@@ -39,20 +51,31 @@ class Workout(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     started: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    name: Mapped[str | None] = mapped_column(String(80))
+    notes: Mapped[str | None] = mapped_column(Text)
 
     exercises: Mapped[List["Exercise"]] = relationship(
         back_populates="workout", cascade="all, delete-orphan"
     )
+    packed_sets: Mapped[List["PackedSets"]] = relationship(
+        back_populates="workout", cascade="all, delete-orphan"
+    )
 
     def __repr__(self):
+        names = [e.exercise_name.name for e in self.exercises]
+        names += [p.exercise_name.name for p in self.packed_sets]
         return (
             f"<Workout(id={self.id}, started={self.started.date().isoformat()}, "
-            f"exercises={', '.join(e.exercise_name.name for e in self.exercises)}>"
+            f"exercises={', '.join(names)}>"
         )
 
 
 class Exercise(Base):
     __tablename__ = "exercises"
+    __table_args__ = (
+        # also serves lookups by workout_id alone
+        Index("ix_exercises_workout_id_exercise_name_id", "workout_id", "exercise_name_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     weight: Mapped[float] = mapped_column(Float, nullable=False)
@@ -62,7 +85,7 @@ class Exercise(Base):
     workout: Mapped["Workout"] = relationship(back_populates="exercises")
 
     exercise_name_id: Mapped[int] = mapped_column(
-        ForeignKey("exercise_names.id"), nullable=False
+        ForeignKey("exercise_names.id"), nullable=False, index=True
     )
     exercise_name: Mapped["ExerciseName"] = relationship(back_populates="exercises")
 
@@ -70,6 +93,113 @@ class Exercise(Base):
         return f"<Exercise(id={self.id}, name={self.exercise_name}, weight={self.weight}, reps={self.reps})>"
 
 
+SET_FORMAT = struct.Struct("<dI")  # weight, reps
+
+
+def pack_sets(sets: Iterable[Tuple[float, int]]) -> bytes:
+    return b"".join(SET_FORMAT.pack(weight, reps) for weight, reps in sets)
+
+
+class SetList(Sequence):
+    """Read-only sequence of (weight, reps) decoded from a packed blob
+
+    Decoding into two arrays happens on first item access."""
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._weights: array | None = None
+        self._reps: array | None = None
+
+    def _decode(self) -> None:
+        self._weights, self._reps = array("d"), array("I")
+        for weight, reps in SET_FORMAT.iter_unpack(self._data):
+            self._weights.append(weight)
+            self._reps.append(reps)
+
+    def __len__(self) -> int:
+        return len(self._data) // SET_FORMAT.size
+
+    def __getitem__(self, index: int | slice):
+        if self._weights is None:
+            self._decode()
+        if isinstance(index, slice):
+            return list(zip(self._weights[index], self._reps[index]))
+        return self._weights[index], self._reps[index]
+
+    def __repr__(self):
+        return f"SetList({list(self)})"
+
+
+class PackedSets(Base):
+    """All sets of one exercise in one workout, stored as a single row
+
+    A compact alternative to one Exercise row per set."""
+
+    __tablename__ = "packed_sets"
+    __table_args__ = (
+        UniqueConstraint("workout_id", "exercise_name_id"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False, default=b"")
+
+    # the unique constraint's index also serves lookups by workout_id
+    workout_id: Mapped[int] = mapped_column(ForeignKey("workouts.id"), nullable=False)
+    workout: Mapped["Workout"] = relationship(back_populates="packed_sets")
+
+    exercise_name_id: Mapped[int] = mapped_column(
+        ForeignKey("exercise_names.id"), nullable=False, index=True
+    )
+    exercise_name: Mapped["ExerciseName"] = relationship()
+
+    @reconstructor
+    def _init_on_load(self) -> None:
+        self._set_list: SetList | None = None
+
+    @property
+    def sets(self) -> SetList:
+        data = self.data or b""
+        # rebuilt when data was assigned or reloaded, decoded arrays are kept otherwise
+        set_list = getattr(self, "_set_list", None)
+        if set_list is None or set_list._data is not data:
+            set_list = self._set_list = SetList(data)
+        return set_list
+
+    @sets.setter
+    def sets(self, sets: Iterable[Tuple[float, int]]) -> None:
+        self.data = pack_sets(sets)
+
+    def __repr__(self):
+        return f"<PackedSets(id={self.id}, name={self.exercise_name}, sets={self.sets})>"
+
+
+def ensure_schema(engine: Engine) -> None:
+    """Create missing tables, and bring existing ones up to date
+
+    create_all() skips existing tables, so columns (all nullable) and
+    indexes added to the model later are created here, indexes the
+    model replaced are dropped, and the search index and the change log of
+    incremental backups are set up."""
+
+    Base.metadata.create_all(engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(engine.dialect)
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        # replaced by ix_exercises_workout_id_exercise_name_id
+        conn.exec_driver_sql("DROP INDEX IF EXISTS ix_exercises_workout_id")
+        SR.ensure_index(conn)
+        BK.ensure_change_log(conn, [table.name for table in Base.metadata.sorted_tables])
+
+
 def ensure_exercise(session: Session, name: str) -> ExerciseName:
     """Get existing ExerciseName object, or create a new one
 
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+"""Check that the SQL run by Dispatcher commands keeps using indexes
+
+The statements are captured by running every command against a seeded
+in-memory database, then EXPLAIN QUERY PLAN is run for each of them
+against --permanent-db (or the seeded database) and compared with the
+plans recorded in query_plans.json.  EXPLAIN QUERY PLAN doesn't show
+what triggers run, so the WHEN clauses and bodies of the triggers are
+explained too, with new.x/old.x bound as parameters."""
+from typing import Dict, List, Tuple, Any
+from contextlib import redirect_stdout
+from sqlalchemy import (
+    Engine,
+    create_engine,
+    event,
+)
+from sqlalchemy.exc import OperationalError
+
+import argparse
+import argcomplete
+import difflib
+import io
+import json
+import os
+import re
+import sys
+import model as MD
+import dispatcher as D
+
+# commands that don't query the workout tables through the session, and
+# conversions that read whole tables by design
+skip_commands: set[str] = {"backup", "backup_incremental", "pack_sets", "unpack_sets"}
+# tables that must never be scanned as a whole
+no_scan_tables: set[str] = {"exercises"}
+seed_workouts: int = 12
+# Dispatcher attributes set for the capture run
+command_settings: Dict[str, Any] = {"search_query": "squat"}
+
+Plans = Dict[str, List[Dict[str, Any]]]
+
+parser = argparse.ArgumentParser(
+    description="Compare query plans of dispatcher commands with recorded ones",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+parser.add_argument(
+    "--permanent-db", help="db file to explain the queries against (e.g. a copy of production)"
+)
+parser.add_argument(
+    "--expected",
+    default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_plans.json"),
+    help="file with recorded plans",
+)
+parser.add_argument(
+    "--record", help="write current plans to --expected", action="store_true", default=False
+)
+
+
+def seeded_engine() -> Engine:
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    MD.ensure_schema(engine)
+    with MD.Session(engine) as session:
+        dispatcher = D.Dispatcher(session)
+        dispatcher.init_exercises()
+        for _ in range(seed_workouts):
+            dispatcher.add_squat_workout()
+    return engine
+
+
+def capture_statements(engine: Engine) -> Dict[str, List[Tuple[str, Any]]]:
+    """Run each dispatcher command, return its distinct statements with parameters"""
+
+    captured: List[Tuple[str, Any]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            captured.append((" ".join(statement.split()), parameters))
+
+    statements: Dict[str, List[Tuple[str, Any]]] = {}
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        for cmd_name in D.Dispatcher.ensure_commands_collected() or []:
+            if cmd_name in skip_commands:
+                continue
+            captured.clear()
+            with MD.Session(engine) as session, redirect_stdout(io.StringIO()):
+                dispatcher = D.Dispatcher(session)
+                for name, value in command_settings.items():
+                    setattr(dispatcher, name, value)
+                getattr(dispatcher, cmd_name)()
+            seen: Dict[str, Any] = {}
+            for statement, parameters in captured:
+                seen.setdefault(statement, parameters)
+            statements[cmd_name] = list(seen.items())
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return statements
+
+
+def trigger_statements(engine: Engine) -> Dict[str, List[Tuple[str, Any]]]:
+    """Statements of each trigger, keyed by trigger <name>"""
+
+    with engine.connect() as conn:
+        triggers = conn.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY name"
+        ).all()
+    statements: Dict[str, List[Tuple[str, Any]]] = {}
+    for name, sql in triggers:
+        header, body = re.match(r"(.*?)\bBEGIN\b(.*)\bEND\s*$", sql, re.S).groups()
+        when = re.search(r"\bWHEN\b(.*)", header, re.S)
+        parts = ([f"SELECT {when.group(1)}"] if when else []) + body.split(";")
+        statements[f"trigger {name}"] = []
+        for part in parts:
+            if not part.strip():
+                continue
+            statement = " ".join(
+                re.sub(r"\b(new|old)\.(\w+)", r":\1_\2", part).split()
+            )
+            parameters = {key: 1 for key in re.findall(r":(\w+)", statement)}
+            statements[f"trigger {name}"].append((statement, parameters))
+    return statements
+
+
+def explain(engine: Engine, statements: Dict[str, List[Tuple[str, Any]]]) -> Plans:
+    """Plans of STATEMENTS; exit with 1 if the db has no tables or columns they use"""
+
+    plans: Plans = {}
+    with engine.connect() as conn:
+        for cmd_name, cmd_statements in statements.items():
+            try:
+                plans[cmd_name] = [
+                    {
+                        "sql": statement,
+                        "plan": [
+                            row[3]
+                            for row in conn.exec_driver_sql(
+                                f"EXPLAIN QUERY PLAN {statement}", parameters
+                            )
+                        ],
+                    }
+                    for statement, parameters in cmd_statements
+                ]
+            except OperationalError as exc:
+                db = engine.url.database
+                sys.exit(
+                    f"{db}: schema is out of date ({cmd_name}: {exc.orig}), "
+                    f"migrate it with\n"
+                    f"    ./edit_workout.py --permanent-db {db} show_exercise_names"
+                )
+    return plans
+
+
+def check(plans: Plans, expected: Plans) -> List[str]:
+    """Return the problems found, an empty list if there are none"""
+
+    problems: List[str] = []
+    for cmd_name, cmd_plans in plans.items():
+        for entry in cmd_plans:
+            for line in entry["plan"]:
+                words = line.split()
+                # "SCAN exercises" (newer SQLite) or "SCAN TABLE exercises"
+                if words[0] == "SCAN" and no_scan_tables & set(words[1:3]):
+                    problems.append(f"{cmd_name}: {line}\n    in: {entry['sql']}")
+        want = json.dumps(expected.get(cmd_name, []), indent=2).splitlines()
+        got = json.dumps(cmd_plans, indent=2).splitlines()
+        diff = list(
+            difflib.unified_diff(
+                want, got, f"expected/{cmd_name}", f"actual/{cmd_name}", lineterm=""
+            )
+        )
+        if diff:
+            problems.append("\n".join(diff))
+    return problems
+
+
+if __name__ == "__main__":
+    argcomplete.autocomplete(parser)
+    args = parser.parse_args()
+    engine: Engine = seeded_engine()
+    statements = capture_statements(engine)
+    statements.update(trigger_statements(engine))
+    if args.permanent_db:
+        engine = create_engine(f"sqlite+pysqlite:///{args.permanent_db}", future=True)
+    plans = explain(engine, statements)
+    if args.record:
+        with open(args.expected, "w") as f:
+            json.dump(plans, f, indent=2)
+            f.write("\n")
+        sys.exit(0)
+    with open(args.expected) as f:
+        expected: Plans = json.load(f)
+    problems = check(plans, expected)
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
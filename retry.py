@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+"""Retry units of work that fail with "database is locked"
+
+SQLite's busy timeout (`timeout` of the pysqlite connection) makes a
+connection wait for a lock, but some conflicts return SQLITE_BUSY at
+once, e.g. a read transaction that wants to write while another
+connection holds the write lock.  A failed commit can't be resumed by
+the Session, so the whole unit of work is rolled back and run again."""
+from dataclasses import dataclass
+from typing import Callable, TypeVar
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+import random
+import sqlite3
+import time
+
+T = TypeVar("T")
+
+
+class RetriesExhausted(Exception):
+    pass
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 5
+    # delay before the 2nd attempt, doubled for each next one
+    backoff: float = 0.05
+    max_backoff: float = 2.0
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to sleep after failed ATTEMPT (0-based), with jitter"""
+
+        return min(self.max_backoff, self.backoff * 2**attempt) * random.uniform(0.5, 1)
+
+
+@dataclass
+class RetryStats:
+    runs: int = 0
+    attempts: int = 0
+    lock_failures: int = 0
+    gave_up: int = 0
+
+
+def is_locked(exc: OperationalError) -> bool:
+    """True if EXC is SQLITE_BUSY or SQLITE_LOCKED (any extended code)"""
+
+    # FTS5 failing to open its table while another connection holds a
+    # lock says "vtable constructor failed", but the code is SQLITE_BUSY
+    code = getattr(exc.orig, "sqlite_errorcode", None)
+    if code is None:  # Python < 3.11
+        message = str(exc.orig)
+        return "database is locked" in message or "table is locked" in message
+    return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def run_with_retry(
+    session: Session,
+    func: Callable[[], T],
+    policy: RetryPolicy,
+    stats: RetryStats | None = None,
+) -> T:
+    """Call FUNC, rolling SESSION back and calling again while the db is locked"""
+
+    stats = stats if stats is not None else RetryStats()
+    stats.runs += 1
+    last_exc: OperationalError | None = None
+    for attempt in range(policy.attempts):
+        stats.attempts += 1
+        try:
+            return func()
+        except OperationalError as exc:
+            if not is_locked(exc):
+                raise
+            last_exc = exc
+            stats.lock_failures += 1
+            session.rollback()
+            if attempt + 1 < policy.attempts:
+                time.sleep(policy.delay(attempt))
+    stats.gave_up += 1
+    raise RetriesExhausted(
+        f"database still locked after {policy.attempts} attempts"
+    ) from last_exc
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+"""Full-text search over workout names, notes and exercise names
+
+The FTS5 table `workouts_fts` has one row per workout (rowid = workout
+id) and is kept in sync by triggers, so the ORM doesn't need to know
+about it."""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import Connection, DateTime, bindparam, text
+from sqlalchemy.orm import Session
+import re
+
+FTS_TABLE: str = "workouts_fts"
+
+# the indexed text of the workouts w, one row per workout; exercises is
+# not aliased so that query_plan.py recognizes a scan of it
+_INDEXED = """
+SELECT w.id, w.name, w.notes, (
+    SELECT group_concat(name, ' ') FROM (
+        SELECT n.name FROM exercises
+        JOIN exercise_names n ON n.id = exercises.exercise_name_id
+        WHERE exercises.workout_id = w.id
+        UNION
+        SELECT n.name FROM packed_sets
+        JOIN exercise_names n ON n.id = packed_sets.exercise_name_id
+        WHERE packed_sets.workout_id = w.id
+    )
+) FROM workouts w
+"""
+
+
+def _reindex(condition: str) -> str:
+    """Statements replacing the index rows of the workouts whose id CONDITION"""
+
+    return (
+        f"DELETE FROM {FTS_TABLE} WHERE rowid {condition};\n"
+        f"INSERT INTO {FTS_TABLE}(rowid, name, notes, exercises) "
+        f"{_INDEXED} WHERE w.id {condition};"
+    )
+
+
+def _pair_unused(table: str, row: str) -> str:
+    """Condition: no other row of exercises or packed_sets links the workout
+    and exercise name of ROW (new or old) of TABLE
+
+    Only then does the list of exercise names of the workout change."""
+
+    return " AND ".join(
+        f"NOT EXISTS (SELECT 1 FROM {t} WHERE workout_id = {row}.workout_id "
+        f"AND exercise_name_id = {row}.exercise_name_id"
+        + (f" AND id <> {row}.id)" if t == table else ")")
+        for t in ("exercises", "packed_sets")
+    )
+
+
+def _trigger(name: str, event: str, body: str, when: str | None = None) -> str:
+    when = f" WHEN {when}" if when else ""
+    return f"CREATE TRIGGER {name} AFTER {event}{when} BEGIN\n{body}\nEND"
+
+
+FTS_DDL: str = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, notes, exercises, tokenize = 'unicode61')"
+)
+
+TRIGGERS: Dict[str, str] = {
+    name: _trigger(name, *args)
+    for name, *args in [
+        ("workouts_fts_ai", "INSERT ON workouts", _reindex("= new.id")),
+        ("workouts_fts_au", "UPDATE OF name, notes ON workouts", _reindex("= new.id")),
+        (
+            "workouts_fts_ad",
+            "DELETE ON workouts",
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id;",
+        ),
+        (
+            "exercises_fts_ai",
+            "INSERT ON exercises",
+            _reindex("= new.workout_id"),
+            _pair_unused("exercises", "new"),
+        ),
+        (
+            "exercises_fts_ad",
+            "DELETE ON exercises",
+            _reindex("= old.workout_id"),
+            _pair_unused("exercises", "old"),
+        ),
+        (
+            "exercises_fts_au",
+            "UPDATE OF workout_id, exercise_name_id ON exercises",
+            _reindex("IN (old.workout_id, new.workout_id)"),
+            "old.workout_id <> new.workout_id "
+            "OR old.exercise_name_id <> new.exercise_name_id",
+        ),
+        (
+            "packed_sets_fts_ai",
+            "INSERT ON packed_sets",
+            _reindex("= new.workout_id"),
+            _pair_unused("packed_sets", "new"),
+        ),
+        (
+            "packed_sets_fts_ad",
+            "DELETE ON packed_sets",
+            _reindex("= old.workout_id"),
+            _pair_unused("packed_sets", "old"),
+        ),
+        (
+            "exercise_names_fts_au",
+            "UPDATE OF name ON exercise_names",
+            _reindex(
+                "IN (SELECT workout_id FROM exercises WHERE exercise_name_id = new.id "
+                "UNION SELECT workout_id FROM packed_sets WHERE exercise_name_id = new.id)"
+            ),
+        ),
+    ]
+}
+
+
+def ensure_index(conn: Connection) -> None:
+    """Create the FTS table, fill it if it is new, and (re)create changed triggers"""
+
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)
+    ).first()
+    conn.exec_driver_sql(FTS_DDL)
+    if not exists:
+        conn.exec_driver_sql(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, notes, exercises) {_INDEXED}"
+        )
+    installed = dict(
+        conn.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"
+        ).all()
+    )
+    for name, sql in TRIGGERS.items():
+        if installed.get(name) != sql:
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+            conn.exec_driver_sql(sql)
+
+
+def match_expression(query: str) -> str:
+    """Turn free text into an FTS5 query: every word, as a prefix, must match"""
+
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+
+
+@dataclass
+class SearchHit:
+    workout_id: int
+    started: datetime
+    snippet: str
+
+    def __str__(self) -> str:
+        return f"{self.workout_id} {self.started.date().isoformat()} {self.snippet}"
+
+
+_SEARCH = text(
+    f"""
+SELECT w.id, w.started, snippet({FTS_TABLE}, -1, '[', ']', '...', 10)
+FROM {FTS_TABLE} JOIN workouts w ON w.id = {FTS_TABLE}.rowid
+WHERE {FTS_TABLE} MATCH :match
+AND (:since IS NULL OR w.started >= :since)
+AND (:until IS NULL OR w.started < :until)
+ORDER BY rank
+LIMIT :limit
+"""
+).bindparams(
+    bindparam("since", type_=DateTime), bindparam("until", type_=DateTime)
+).columns(started=DateTime)
+
+
+def search(
+    session: Session,
+    query: str,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    limit: int = 20,
+) -> List[SearchHit]:
+    """Best matching workouts for QUERY started in [SINCE, UNTIL)"""
+
+    match = match_expression(query)
+    if not match:
+        return []
+    rows = session.execute(
+        _SEARCH, {"match": match, "since": since, "until": until, "limit": limit}
+    )
+    return [SearchHit(*row) for row in rows]
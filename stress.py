@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+"""Run writer and reader processes against one db file
+
+Writers run add_squat_workout, readers alternate search and
+show_workouts, all through Dispatcher.run() so the retry policy applies.
+One line is printed per configuration (every combination of the list
+options)."""
+from typing import Any, Dict, List
+from contextlib import redirect_stdout
+from itertools import product
+from sqlalchemy import create_engine
+
+import argparse
+import argcomplete
+import io
+import multiprocessing
+import os
+import queue
+import statistics
+import tempfile
+import time
+import model as MD
+import dispatcher as D
+import retry as RT
+
+parser = argparse.ArgumentParser(
+    description="Measure throughput and lock failures of concurrent dispatchers",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+parser.add_argument("--writers", type=int, nargs="+", default=[4], help="writer processes")
+parser.add_argument("--readers", type=int, nargs="+", default=[2], help="reader processes")
+parser.add_argument(
+    "--busy-timeout", type=float, nargs="+", default=[5.0], help="seconds to wait for a lock"
+)
+parser.add_argument(
+    "--attempts", type=int, nargs="+", default=[5], help="tries per command"
+)
+parser.add_argument(
+    "--backoff",
+    type=float,
+    nargs="+",
+    default=[0.05],
+    help="seconds to wait before the 2nd attempt",
+)
+parser.add_argument(
+    "--max-backoff",
+    type=float,
+    nargs="+",
+    default=[2.0],
+    help="max seconds to wait between attempts",
+)
+parser.add_argument(
+    "--journal-mode", nargs="+", default=["delete"], choices=["delete", "wal"]
+)
+parser.add_argument("--seconds", type=float, default=5.0, help="duration of each run")
+parser.add_argument("--seed-workouts", type=int, default=200, help="workouts to start with")
+
+
+def worker(
+    role: str, db_path: str, config: Dict[str, Any], deadline: float, results
+) -> None:
+    """Run commands until DEADLINE, always put (role, latencies, stats, errors)"""
+
+    latencies: List[float] = []
+    stats = RT.RetryStats()
+    # commands failed with something else than a lock, by exception type
+    errors: Dict[str, int] = {}
+    try:
+        engine = create_engine(
+            f"sqlite+pysqlite:///{db_path}",
+            future=True,
+            connect_args={"timeout": config["busy_timeout"]},
+        )
+        with MD.Session(engine) as session, redirect_stdout(io.StringIO()):
+            dispatcher = D.Dispatcher(session)
+            dispatcher.retry_policy = RT.RetryPolicy(
+                attempts=config["attempts"],
+                backoff=config["backoff"],
+                max_backoff=config["max_backoff"],
+            )
+            dispatcher.retry_stats = stats
+            dispatcher.search_query = "squat"
+            commands = (
+                ["add_squat_workout"] if role == "writer" else ["search", "show_workouts"]
+            )
+            i = 0
+            while time.time() < deadline:
+                started = time.perf_counter()
+                try:
+                    dispatcher.run(commands[i % len(commands)])
+                except RT.RetriesExhausted:
+                    pass
+                except Exception as exc:
+                    errors[type(exc).__name__] = errors.get(type(exc).__name__, 0) + 1
+                    session.rollback()
+                else:
+                    latencies.append(time.perf_counter() - started)
+                i += 1
+                # show_workouts loads whole history, keep the session small
+                session.expunge_all()
+    except Exception as exc:
+        errors[type(exc).__name__] = errors.get(type(exc).__name__, 0) + 1
+    finally:
+        results.put((role, latencies, stats, errors))
+
+
+def percentile(values: List[float], p: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[p - 1]
+
+
+def run(config: Dict[str, Any], seconds: float, seed_workouts: int) -> str:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "stress.db")
+        engine = create_engine(f"sqlite+pysqlite:///{db_path}", future=True)
+        MD.ensure_schema(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA journal_mode={config['journal_mode']}")
+        with MD.Session(engine) as session:
+            dispatcher = D.Dispatcher(session)
+            dispatcher.init_exercises()
+            for _ in range(seed_workouts):
+                dispatcher.add_squat_workout()
+        engine.dispose()
+
+        results = multiprocessing.Queue()
+        deadline = time.time() + seconds
+        roles = ["writer"] * config["writers"] + ["reader"] * config["readers"]
+        processes = [
+            multiprocessing.Process(
+                target=worker, args=(role, db_path, config, deadline, results)
+            )
+            for role in roles
+        ]
+        for p in processes:
+            p.start()
+        collected = []
+        while len(collected) < len(processes):
+            try:
+                collected.append(results.get(timeout=1))
+            except queue.Empty:
+                # a worker killed before it could report
+                if not any(p.is_alive() for p in processes) and results.empty():
+                    break
+        for p in processes:
+            p.join()
+        crashed = len(processes) - len(collected)
+
+    latencies: Dict[str, List[float]] = {"writer": [], "reader": []}
+    stats = RT.RetryStats()
+    errors: Dict[str, int] = {}
+    for role, role_latencies, worker_stats, worker_errors in collected:
+        latencies[role] += role_latencies
+        stats.runs += worker_stats.runs
+        stats.attempts += worker_stats.attempts
+        stats.lock_failures += worker_stats.lock_failures
+        stats.gave_up += worker_stats.gave_up
+        for name, count in worker_errors.items():
+            errors[name] = errors.get(name, 0) + count
+    writes = latencies["writer"]
+    return (
+        f"{config['writers']:>2}w {config['readers']:>2}r "
+        f"{config['journal_mode']:>6} timeout={config['busy_timeout']:<4} "
+        f"attempts={config['attempts']:<2} "
+        f"backoff={config['backoff']:<4}/{config['max_backoff']:<4} | "
+        f"writes/s={len(writes) / seconds:8.1f} "
+        f"reads/s={len(latencies['reader']) / seconds:8.1f} "
+        f"commit p50={percentile(writes, 50) * 1000:7.1f}ms "
+        f"p99={percentile(writes, 99) * 1000:7.1f}ms "
+        f"lock failures={stats.lock_failures / max(stats.attempts, 1):6.1%} "
+        f"gave up={stats.gave_up} "
+        f"errors={sum(errors.values())}{sorted(errors.items()) if errors else ''} "
+        f"crashed={crashed}"
+    )
+
+
+if __name__ == "__main__":
+    argcomplete.autocomplete(parser)
+    args = parser.parse_args()
+    for (
+        writers,
+        readers,
+        busy_timeout,
+        attempts,
+        backoff,
+        max_backoff,
+        journal_mode,
+    ) in product(
+        args.writers,
+        args.readers,
+        args.busy_timeout,
+        args.attempts,
+        args.backoff,
+        args.max_backoff,
+        args.journal_mode,
+    ):
+        config = {
+            "writers": writers,
+            "readers": readers,
+            "busy_timeout": busy_timeout,
+            "attempts": attempts,
+            "backoff": backoff,
+            "max_backoff": max_backoff,
+            "journal_mode": journal_mode,
+        }
+        print(run(config, args.seconds, args.seed_workouts), flush=True)